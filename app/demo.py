@@ -1,78 +1,293 @@
-import ollama
+import argparse
+import asyncio
+import os
 import subprocess
+import shutil
+import socket
+import tempfile
+import threading
 import time
-import atexit
+import random
+from urllib.parse import urlsplit
 import signal
 import sys
+from functools import lru_cache
+
+# Make the project root importable when run as `python app/demo.py`; importers already have it
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import llm_cache
+from app.streaming import stream_chat
+
+# Default address the Ollama server listens on (OLLAMA_HOST overrides it, as for the client and server)
+OLLAMA_HOST = "127.0.0.1"
+OLLAMA_PORT = 11434
+
+# Number of user/assistant exchanges kept verbatim in the chat history sent to the model
+MAX_TURNS = 12
+
+# Rough token budget for verbatim history (estimated at ~4 characters per token)
+HISTORY_TOKEN_BUDGET = 3000
+
+# Oldest exchanges folded into the running summary each time history is compacted
+COMPACT_TURNS = 5
+
+# Pinned at the start of every chat request so the prompt prefix stays stable
+SYSTEM_MESSAGE = {'role': 'system', 'content': 'You are a helpful, friendly AI assistant.'}
+
+# Inputs that leave the chat or Q&A loop
+QUIT_COMMANDS = frozenset({'quit', 'exit', 'q'})
+
+# Menu and banner rules
+SEPARATOR = "=" * 50
+DIVIDER = "-" * 50
+
+def ollama_address():
+    """Host and port to probe, taken from OLLAMA_HOST like the ollama client does"""
+    host = os.environ.get('OLLAMA_HOST', '').strip()
+    if not host:
+        return OLLAMA_HOST, OLLAMA_PORT
+    # Without a scheme the Ollama port is the default; with one, the scheme's port is
+    default_port = OLLAMA_PORT
+    if '://' not in host:
+        host = f"http://{host}"
+    else:
+        default_port = 443 if host.startswith('https://') else 80
+    try:
+        parsed = urlsplit(host)
+        port = parsed.port or default_port
+    except ValueError:
+        return OLLAMA_HOST, OLLAMA_PORT
+    hostname = parsed.hostname
+    # A server bound to every interface is reached via loopback
+    if not hostname or hostname in ('0.0.0.0', '::'):
+        hostname = OLLAMA_HOST
+    return hostname, port
 
 class OllamaManager:
     def __init__(self):
         self.ollama_process = None
+        self.server_log = None  # Captures 'ollama serve' stderr for startup diagnostics
         self.started_by_us = False
+        self.startup_retries = 8  # Readiness probes after spawning the server
+        self.max_retry_delay = 8  # Upper bound (seconds) on the backoff between probes
+        self.shutdown_grace = 5  # Seconds to wait after SIGTERM before escalating to SIGKILL
+        self.server_ready = False
+    
+    def __enter__(self):
+        """Make sure a server is running for the duration of the block"""
+        try:
+            self.server_ready = self.ensure_ollama_running()
+        except BaseException:
+            # __exit__ won't run if we don't return, and the detached server never sees Ctrl+C
+            self.shutdown_ollama()
+            raise
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the server on the way out if we started it, however the block ended"""
+        self.shutdown_ollama()
+        return False
     
     def ensure_ollama_running(self):
         """Ensure Ollama server is running"""
-        try:
-            # Try to ping Ollama
-            ollama.list()
+        # A bound port is enough to know a server is up; skip the HTTP round-trip
+        if self._port_open(timeout=0.1):
             print("Ollama server is already running")
             return True
-        except Exception as e:
-            print("Starting Ollama server...")
-            try:
-                # Start Ollama server in background (macOS optimized)
-                self.ollama_process = subprocess.Popen(
-                    ['ollama', 'serve'], 
-                    stdout=subprocess.DEVNULL, 
-                    stderr=subprocess.DEVNULL
-                )
-                self.started_by_us = True
-                # Wait a moment for server to start
-                time.sleep(3)
-                return True
-            except Exception as startup_error:
-                print(f"Failed to start Ollama server: {startup_error}")
+        
+        ollama_bin = shutil.which('ollama')
+        if ollama_bin is None:
+            print("Ollama executable not found on PATH. Install it from https://ollama.com")
+            return False
+        
+        print("Starting Ollama server...")
+        try:
+            # Start Ollama server in background (macOS optimized).
+            # stderr goes to a temp file rather than a pipe nobody drains, which would stall the server.
+            self.server_log = tempfile.TemporaryFile()
+            self.ollama_process = subprocess.Popen(
+                [ollama_bin, 'serve'], 
+                stdout=subprocess.DEVNULL, 
+                stderr=self.server_log,
+                **self._detach_options()
+            )
+            self.started_by_us = True
+            return self._wait_until_ready()
+        except Exception as startup_error:
+            print(f"Failed to start Ollama server: {startup_error}")
+            if not self.started_by_us and self.server_log is not None:
+                # No server to hand the log to, so shutdown_ollama would never close it
+                self.server_log.close()
+                self.server_log = None
+            return False
+    
+    def _detach_options(self):
+        """Popen options that keep Ctrl+C in the demo from reaching the server"""
+        # The server gets its own process group; shutdown_ollama stops it explicitly
+        if os.name == 'nt':
+            return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        return {'start_new_session': True}
+    
+    def _kill_server(self):
+        """Force kill the server together with the model runners it spawned"""
+        if os.name == 'nt':
+            self.ollama_process.kill()
+            return
+        try:
+            # The server leads its own process group, so this also reaches its runners
+            os.killpg(self.ollama_process.pid, signal.SIGKILL)
+        except OSError:
+            self.ollama_process.kill()
+    
+    def _port_open(self, timeout=0.25):
+        """Check whether the Ollama port accepts TCP connections"""
+        try:
+            socket.create_connection(ollama_address(), timeout=timeout).close()
+            return True
+        except OSError:
+            return False
+    
+    def _wait_until_ready(self):
+        """Poll the server with exponential backoff until it answers"""
+        # Imported lazily: the client pulls in httpx/pydantic, which is slow to load
+        import ollama
+        
+        delay = 0.25
+        for attempt in range(self.startup_retries):
+            # No point waiting on a server that already died
+            if self.ollama_process.poll() is not None:
+                print(f"Ollama server exited during startup (code {self.ollama_process.returncode})")
+                self._print_server_log()
                 return False
+            # Cheap TCP probe while booting; only hit the HTTP API once the port is bound
+            if self._port_open():
+                try:
+                    ollama.list()
+                    return True
+                except Exception:
+                    pass
+            # Jitter keeps retries from lining up with a slow server boot
+            time.sleep(delay * (1 + random.random() * 0.5))
+            delay = min(delay * 2, self.max_retry_delay)
+        print("Ollama server did not become ready in time")
+        self._print_server_log()
+        return False
+    
+    def _print_server_log(self, max_bytes=200):
+        """Show the tail of the server's stderr to help diagnose startup failures"""
+        if self.server_log is None:
+            return
+        try:
+            size = self.server_log.seek(0, 2)
+            self.server_log.seek(max(0, size - max_bytes))
+            tail = self.server_log.read().decode(errors='replace').strip()
+            if tail:
+                print(f"Last server output:\n{tail}")
+        except (OSError, ValueError):
+            pass
+    
+    def warm_up_model(self, model='gemma3:270m'):
+        """Load the model into memory ahead of the first real request"""
+        import ollama
+        
+        try:
+            # An empty prompt only loads the model; keep_alive keeps it resident afterwards
+            ollama.generate(model=model, prompt='', keep_alive=llm_cache.KEEP_ALIVE)
+        except Exception:
+            # Warm-up is best effort; the first request will load the model instead
+            pass
     
     def shutdown_ollama(self):
         """Shutdown Ollama server if we started it"""
         if self.started_by_us and self.ollama_process:
             print("Shutting down Ollama server...")
             try:
+                # Ask politely first so Ollama can unload models and release the port
                 self.ollama_process.terminate()
-                # Give it a moment to shutdown gracefully
-                self.ollama_process.wait(timeout=5)
+                self.ollama_process.wait(timeout=self.shutdown_grace)
             except subprocess.TimeoutExpired:
-                # Force kill if it doesn't shutdown gracefully
-                self.ollama_process.kill()
+                # Force kill if it doesn't shutdown within the grace period
+                self._kill_server()
                 self.ollama_process.wait()
-            except:
+            except Exception:
                 pass
             finally:
                 self.ollama_process = None
                 self.started_by_us = False
+                if self.server_log is not None:
+                    self.server_log.close()
+                    self.server_log = None
 
-# Create Ollama manager instance
-ollama_manager = OllamaManager()
+# Exit on SIGTERM; SystemExit passes the menus' Ctrl+C handlers but still runs OllamaManager.__exit__
+def signal_handler(sig, frame):
+    sys.exit(128 + sig)
 
-# Register cleanup function to run on exit
-atexit.register(ollama_manager.shutdown_ollama)
+def summarize_history(messages, summary=None, model='gemma3:270m'):
+    """Condense older chat messages (and any previous summary) into a short summary"""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if summary:
+        transcript = f"Earlier summary:\n{summary}\n\n{transcript}"
+    prompt = f"""Summarize the conversation below in at most 5 short bullet points.
+Keep names, facts and decisions the assistant may need later.
 
-# Handle Ctrl+C gracefully
-def signal_handler(sig, frame):
-    print("\nReceived interrupt signal, cleaning up...")
-    ollama_manager.shutdown_ollama()
-    sys.exit(0)
+{transcript}"""
+    response = llm_cache.cached_chat(model, [{'role': 'user', 'content': prompt}])
+    return response['message']['content'].strip()
 
-signal.signal(signal.SIGINT, signal_handler)
+@lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """Rough token count for a message (~4 characters per token), memoized per text"""
+    return max(1, len(text) // 4)
+
+class ChatHistory:
+    """Recent exchanges kept verbatim plus a running summary of older ones"""
+    
+    def __init__(self):
+        self.messages = []
+        self.summary = None
+        self.tokens = 0  # Running estimate for self.messages, updated as they change
+    
+    def append(self, message):
+        """Add a message and count its tokens once"""
+        self.messages.append(message)
+        self.tokens += estimate_tokens(message['content'])
+    
+    def over_budget(self):
+        """Whether the verbatim history is too long to keep sending as is"""
+        return len(self.messages) > 2 * MAX_TURNS or self.tokens > HISTORY_TOKEN_BUDGET
+    
+    def compact(self):
+        """Fold the oldest exchanges into the summary once history is over budget"""
+        if not self.over_budget():
+            return
+        
+        oldest = self.messages[:2 * COMPACT_TURNS]
+        del self.messages[:2 * COMPACT_TURNS]
+        self.tokens -= sum(estimate_tokens(m['content']) for m in oldest)
+        try:
+            self.summary = summarize_history(oldest, self.summary)
+        except Exception:
+            # Fall back to a plain sliding window if the model can't summarize
+            pass
+    
+    def build_messages(self, user_message):
+        """Static system prompt, then summary and committed history, then the new message"""
+        # Earlier entries are only rewritten on compaction, so Ollama can reuse the cached prefix
+        messages = [SYSTEM_MESSAGE]
+        if self.summary:
+            messages.append({'role': 'system', 'content': f"Summary of the earlier conversation:\n{self.summary}"})
+        messages += self.messages
+        messages.append(user_message)
+        return messages
 
 def chat():
     """Interactive chat function similar to ChatGPT"""
     print("🤖 Welcome to GenAI Chat! (Type 'quit', 'exit', or 'q' to stop)")
-    print("=" * 50)
+    print(SEPARATOR)
     
-    # Initialize conversation history
-    conversation = []
+    # Recent exchanges are kept verbatim; older ones are folded into a summary
+    history = ChatHistory()
     
     while True:
         try:
@@ -80,7 +295,7 @@ def chat():
             user_input = input("\n👤 You: ").strip()
             
             # Check for quit commands
-            if user_input.lower() in ['quit', 'exit', 'q']:
+            if user_input.lower() in QUIT_COMMANDS:
                 print("\n👋 Goodbye! Thanks for chatting!")
                 break
             
@@ -89,19 +304,17 @@ def chat():
                 print("Please enter a message or 'quit' to exit.")
                 continue
             
-            # Add user message to conversation
-            conversation.append({'role': 'user', 'content': user_input})
+            user_message = {'role': 'user', 'content': user_input}
+            messages = history.build_messages(user_message)
             
-            # Get AI response
+            # Stream AI response so the first tokens show up immediately
             print("🤖 AI: ", end="", flush=True)
-            response = ollama.chat(model='gemma3:270m', messages=conversation)
-            ai_response = response['message']['content']
+            ai_response = stream_chat(messages)
             
-            # Print AI response
-            print(ai_response)
-            
-            # Add AI response to conversation history
-            conversation.append({'role': 'assistant', 'content': ai_response})
+            # Commit the exchange to history only once it succeeded
+            history.append(user_message)
+            history.append({'role': 'assistant', 'content': ai_response})
+            history.compact()
             
         except KeyboardInterrupt:
             print("\n\n👋 Chat interrupted. Goodbye!")
@@ -110,21 +323,70 @@ def chat():
             print(f"\n❌ Error: {e}")
             print("Please try again or type 'quit' to exit.")
 
+async def achat_many(prompts, model='gemma3:270m'):
+    """Send independent prompts concurrently and return the replies in order"""
+    from ollama import AsyncClient
+    
+    client = AsyncClient()
+    requests = [
+        client.chat(
+            model=model,
+            messages=[{'role': 'user', 'content': prompt}],
+            keep_alive=llm_cache.KEEP_ALIVE
+        )
+        for prompt in prompts
+    ]
+    responses = await asyncio.gather(*requests)
+    return [response['message']['content'] for response in responses]
+
+def batch_chat():
+    """Answer several independent questions in one concurrent batch"""
+    print("📦 Batch Q&A - Enter one question per line, empty line to send")
+    print("💡 Start Ollama with OLLAMA_NUM_PARALLEL=8 to answer them in parallel.")
+    print(SEPARATOR)
+    
+    questions = []
+    try:
+        while True:
+            question = input(f"❓ Question {len(questions) + 1}: ").strip()
+            if not question:
+                break
+            if question.lower() in QUIT_COMMANDS:
+                print("\n👋 Returning to main menu...")
+                return
+            questions.append(question)
+    except KeyboardInterrupt:
+        print("\n\n👋 Batch Q&A interrupted. Returning to menu...")
+        return
+    
+    if not questions:
+        print("No questions entered.")
+        return
+    
+    print(f"\n🤔 Sending {len(questions)} question(s)...")
+    try:
+        answers = asyncio.run(achat_many(questions))
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        return
+    
+    for i, (question, answer) in enumerate(zip(questions, answers), 1):
+        print(f"\n[{i}] ❓ {question}")
+        print(f"🤖 {answer}")
+
 def generative():
     """Generate instructions based on PDF documents using RAG"""
     print("📄 Generative Document Analysis with RAG")
-    print("=" * 50)
+    print(SEPARATOR)
     
     try:
         # Import required libraries
-        import sys
-        import os
-        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         from rag_system import RAGSystem
         
         # Initialize RAG system
         print("� Initializing RAG system...")
-        rag = RAGSystem()
+        # Answers share the chat mode's response cache, keep_alive and batched printer
+        rag = RAGSystem(chat=llm_cache.cached_chat, stream_chat=stream_chat)
         
         # Check for PDF documents
         pdf_files = rag.find_pdf_files()
@@ -148,18 +410,19 @@ def generative():
             return
         
         print("✅ Documents processed successfully!")
-        print("\n" + "=" * 50)
+        print("\n" + SEPARATOR)
         print("🤖 RAG-Powered Q&A System Ready!")
         print("Ask questions about your documents or request analysis.")
+        print("Separate several questions with ';' to answer them in one batch.")
         print("Type 'quit', 'exit', or 'q' to return to main menu.")
-        print("=" * 50)
+        print(SEPARATOR)
         
         # Interactive Q&A loop
         while True:
             try:
                 question = input("\n❓ Your Question: ").strip()
                 
-                if question.lower() in ['quit', 'exit', 'q']:
+                if question.lower() in QUIT_COMMANDS:
                     print("\n👋 Returning to main menu...")
                     break
                 
@@ -168,9 +431,18 @@ def generative():
                     continue
                 
                 print("\n🔍 Searching documents...")
-                answer = rag.query(question)
                 
-                print(f"\n🤖 AI Analysis:\n{answer}")
+                # Several questions share one retrieval context and one model call
+                batch = [q.strip() for q in question.split(';') if q.strip()]
+                if len(batch) > 1:
+                    answers = rag.batch_query(batch)
+                    for i, (q, answer) in enumerate(zip(batch, answers), 1):
+                        print(f"\n[{i}] ❓ {q}")
+                        print(f"🤖 AI Analysis:\n{answer}")
+                    continue
+                
+                # Streamed: the answer is printed as it is generated
+                rag.query(question, stream=True)
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Document analysis interrupted. Returning to menu...")
@@ -182,43 +454,68 @@ def generative():
     except ImportError:
         print("❌ RAG system dependencies not installed.")
         print("\n📦 Required packages:")
-        print("   pip install sentence-transformers PyPDF2 faiss-cpu numpy")
+        print("   pip install sentence-transformers pypdfium2 PyPDF2 faiss-cpu numpy")
         print("\n💡 Run the installation command and try again.")
         input("\nPress Enter to return to main menu...")
     except Exception as e:
         print(f"❌ Error initializing RAG system: {e}")
         input("\nPress Enter to return to main menu...")
 
+# Main menu, built once and written in a single call each time it is shown
+MENU_BANNER = "\n".join([
+    "",
+    SEPARATOR,
+    "🚀 GenAI Demo - Choose an option:",
+    SEPARATOR,
+    "1. 💬 Interactive Chat",
+    "2. 📄 Document Analysis (Coming Soon)",
+    "3. 📦 Batch Q&A",
+    "4. 🚪 Exit",
+    DIVIDER,
+    "",
+])
+
+# Main menu choices mapped to the mode they start (4 exits)
+MENU_ACTIONS = {'1': chat, '2': generative, '3': batch_chat}
+
 def main_menu():
     """Display main menu and handle user selection"""
     while True:
-        print("\n" + "=" * 50)
-        print("🚀 GenAI Demo - Choose an option:")
-        print("=" * 50)
-        print("1. 💬 Interactive Chat")
-        print("2. 📄 Document Analysis (Coming Soon)")
-        print("3. 🚪 Exit")
-        print("-" * 50)
+        sys.stdout.write(MENU_BANNER)
+        sys.stdout.flush()
         
-        choice = input("Enter your choice (1-3): ").strip()
+        choice = input("Enter your choice (1-4): ").strip()
         
-        if choice == '1':
-            chat()
-        elif choice == '2':
-            generative()
-        elif choice == '3':
+        if choice == '4':
             print("\n👋 Goodbye!")
             break
-        else:
-            print("❌ Invalid choice. Please enter 1, 2, or 3.")
+        action = MENU_ACTIONS.get(choice)
+        if action is None:
+            print("❌ Invalid choice. Please enter 1, 2, 3, or 4.")
+            continue
+        action()
 
-try:
-    # Ensure Ollama is running before making requests
-    ollama_manager.ensure_ollama_running()
+def main():
+    """Parse arguments, start Ollama if needed and run the menu"""
+    parser = argparse.ArgumentParser(description='GenAI Demo - AI Assistant')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always query the model instead of reusing cached responses')
+    args = parser.parse_args()
+    llm_cache.enabled = not args.no_cache
+    
+    signal.signal(signal.SIGTERM, signal_handler)
     
-    # Start the main menu
-    main_menu()
+    try:
+        # Ollama is started if needed and shut down again when the block exits
+        with OllamaManager() as ollama_manager:
+            # Load the model in the background while the menu is shown
+            if ollama_manager.server_ready:
+                threading.Thread(target=ollama_manager.warm_up_model, daemon=True).start()
+            
+            # Start the main menu
+            main_menu()
+    except KeyboardInterrupt:
+        print("\n👋 Interrupted. Goodbye!")
 
-finally:
-    # Ensure cleanup happens even if there's an exception
-    ollama_manager.shutdown_ollama()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Disk-backed cache for Ollama chat responses
+
+Responses are stored in a small SQLite database keyed by a hash of the model
+name and the exact message list, so repeating an identical prompt returns the
+saved answer instantly instead of running inference again.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Optional
+
+# Location of the SQLite database (shares the RAG system's cache folder)
+CACHE_PATH = os.path.join("cache", "llm_cache.sqlite")
+
+# Set to False (e.g. via --no-cache) to always query the model
+enabled = True
+
+# How long Ollama keeps the model loaded after a request, so replies after a pause skip the reload
+KEEP_ALIVE = '30m'
+
+_conn = None
+
+
+def _connection() -> sqlite3.Connection:
+    """Open the cache database on first use"""
+    global _conn
+    if _conn is None:
+        folder = os.path.dirname(CACHE_PATH)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH)
+        _conn.execute("CREATE TABLE IF NOT EXISTS cache (k TEXT PRIMARY KEY, resp TEXT)")
+    return _conn
+
+
+def close():
+    """Close the cache database (it is reopened on next use)"""
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+
+def cache_key(model: str, messages) -> str:
+    """Hash the model and messages into a cache key"""
+    payload = model + json.dumps([dict(message) for message in messages], sort_keys=True)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def get(model: str, messages) -> Optional[str]:
+    """Return the cached reply text, or None on a miss"""
+    if not enabled:
+        return None
+    row = _connection().execute(
+        "SELECT resp FROM cache WHERE k=?", (cache_key(model, messages),)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def put(model: str, messages, content: str):
+    """Store a reply for later reuse"""
+    if not enabled:
+        return
+    conn = _connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO cache VALUES (?, ?)",
+        (cache_key(model, messages), json.dumps(content))
+    )
+    conn.commit()
+
+
+def cached_chat(model: str, messages) -> dict:
+    """Drop-in replacement for ollama.chat that reuses cached replies"""
+    content = get(model, messages)
+    if content is None:
+        import ollama
+
+        response = ollama.chat(model=model, messages=messages, keep_alive=KEEP_ALIVE)
+        content = response['message']['content']
+        put(model, messages, content)
+    return {'message': {'role': 'assistant', 'content': content}}
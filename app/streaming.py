@@ -0,0 +1,46 @@
+"""
+Streamed printing of Ollama chat replies
+
+Tokens are written to the terminal as they arrive, in small batches, and the
+full reply is returned so it can be kept in the conversation history. Replies
+go through the response cache like non-streamed requests.
+"""
+
+import sys
+
+from app import llm_cache
+
+# Streamed tokens are written to the terminal in batches of at least this many characters
+STREAM_FLUSH_CHARS = 64
+
+
+def stream_chat(messages, model='gemma3:270m'):
+    """Print a streamed model reply as it arrives and return the full text"""
+    import ollama
+    
+    # Identical conversations are answered from the response cache
+    cached = llm_cache.get(model, messages)
+    if cached is not None:
+        print(cached)
+        return cached
+    
+    parts = []
+    flushed = 0  # Parts already written to the terminal
+    pending = 0  # Characters received since the last write
+    stream = ollama.chat(model=model, messages=messages, stream=True, keep_alive=llm_cache.KEEP_ALIVE)
+    for chunk in stream:
+        token = chunk['message']['content']
+        parts.append(token)
+        pending += len(token)
+        # Batch tokens so the terminal sees one write per few words, not per token,
+        # but finish each line straight away so the reply doesn't appear to stall
+        if pending >= STREAM_FLUSH_CHARS or '\n' in token:
+            sys.stdout.write("".join(parts[flushed:]))
+            sys.stdout.flush()
+            flushed = len(parts)
+            pending = 0
+    sys.stdout.write("".join(parts[flushed:]))
+    print()
+    reply = "".join(parts)
+    llm_cache.put(model, messages, reply)
+    return reply
@@ -4,7 +4,7 @@ RAG (Retrieval-Augmented Generation) System for GenAI Demo
 This module implements a simple but effective RAG system using:
 - sentence-transformers for embeddings (bge-large-en-v1.5)
 - FAISS for vector similarity search
-- PyPDF2 for PDF text extraction
+- pypdfium2 for PDF text extraction (PyPDF2 as a fallback)
 - Ollama gemma3:270m for text generation
 
 Features:
@@ -15,58 +15,238 @@ Features:
 - Ultra-lightweight model (270M parameters) for fast responses
 """
 
+import math
+import multiprocessing
 import os
 import pickle
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
-from typing import List, Tuple, Optional
-import ollama
+from typing import Callable, List, Tuple, Optional
+
+
+# Fixed parts of the single-question prompt, joined around the context and question
+_PROMPT_PREFIX = """Based on the following document excerpts, please answer the question thoroughly and accurately.
+
+CONTEXT:
+"""
+_PROMPT_QUESTION = """
+
+QUESTION: """
+_PROMPT_SUFFIX = """
+
+Please provide a detailed answer based solely on the information in the provided context. If the context doesn't contain enough information to answer the question completely, please mention what additional information would be helpful.
+
+ANSWER:"""
+
+
+def _extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from PDF file (PDFium when installed, PyPDF2 otherwise)"""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return _extract_text_with_pypdf2(pdf_path)
+    
+    try:
+        # PDFium is a C++ parser, several times faster than pure-Python PyPDF2
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return "".join(page.get_textpage().get_text_range() + "\n" for page in pdf)
+        finally:
+            pdf.close()
+    except Exception as e:
+        print(f"❌ Error reading PDF {pdf_path}: {e}")
+        return ""
+
+
+def _extract_text_with_pypdf2(pdf_path: str) -> str:
+    """Extract text from PDF file with the pure-Python PyPDF2 parser"""
+    try:
+        import PyPDF2
+        
+        text = ""
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page in pdf_reader.pages:
+                text += page.extract_text() + "\n"
+        return text
+    except ImportError:
+        print("❌ No PDF parser installed. Run: pip install pypdfium2 (or PyPDF2)")
+        return ""
+    except Exception as e:
+        print(f"❌ Error reading PDF {pdf_path}: {e}")
+        return ""
+
+
+def _is_boilerplate(text: str) -> bool:
+    """Spot low-information chunks (tables of contents, page numbers, rules) not worth embedding"""
+    counts = Counter(text)
+    total = len(text)
+    
+    # Mostly whitespace and leader characters: TOC dot leaders, horizontal rules.
+    # Digits don't count, so results tables with labelled numbers are kept.
+    filler = sum(n for ch, n in counts.items() if ch.isspace() or ch in '.-_')
+    if filler > 0.6 * total:
+        return True
+    
+    # Shannon entropy of the character distribution; prose and tables sit around 4+ bits
+    # per character, runs of bare page numbers below 3.5
+    entropy = -sum(n / total * math.log2(n / total) for n in counts.values())
+    return entropy < 3.5
+
+
+def _chunk_text(text: str, filename: str, chunk_size: int, chunk_overlap: int) -> List[dict]:
+    """Split text into overlapping chunks"""
+    # Simple chunking by characters, stripping each window once
+    step = chunk_size - chunk_overlap
+    windows = (text[i:i + chunk_size].strip() for i in range(0, len(text), step))
+    
+    # Skip very short chunks and boilerplate
+    kept = [window for window in windows if len(window) >= 50 and not _is_boilerplate(window)]
+    
+    return [
+        {'text': chunk_text, 'source': filename, 'chunk_id': chunk_id}
+        for chunk_id, chunk_text in enumerate(kept)
+    ]
+
+
+def _extract_and_chunk(job: Tuple[str, int, int]) -> Optional[List[dict]]:
+    """Extract and chunk one PDF (module level so worker processes can run it)
+    
+    Returns None when no text could be extracted.
+    """
+    pdf_path, chunk_size, chunk_overlap = job
+    text = _extract_text_from_pdf(pdf_path)
+    if not text.strip():
+        return None
+    return _chunk_text(text, os.path.basename(pdf_path), chunk_size, chunk_overlap)
+
+
+def _ollama_chat(model: str, messages: List[dict]) -> dict:
+    """Plain ollama.chat call, used when no chat function is passed in"""
+    import ollama
+    
+    return ollama.chat(model=model, messages=messages)
+
+
+def _ollama_stream(messages: List[dict], model: str = 'gemma3:270m') -> str:
+    """Print a streamed ollama.chat reply as it arrives and return the full text"""
+    import ollama
+    
+    parts = []
+    for chunk in ollama.chat(model=model, messages=messages, stream=True):
+        token = chunk['message']['content']
+        print(token, end="", flush=True)
+        parts.append(token)
+    print()
+    return "".join(parts)
 
 
 class RAGSystem:
-    """RAG system for document-based question answering"""
+    """RAG system for document-based question answering
+    
+    chat(model, messages) returns an ollama.chat style response and
+    stream_chat(messages) prints a streamed reply and returns its text; the demo
+    app passes its cached versions, and plain Ollama calls are used otherwise.
+    """
     
-    def __init__(self, documents_folder: str = "documents", cache_folder: str = "cache"):
+    def __init__(self, documents_folder: str = "documents", cache_folder: str = "cache",
+                 chat: Optional[Callable[[str, List[dict]], dict]] = None,
+                 stream_chat: Optional[Callable[[List[dict]], str]] = None):
         self.documents_folder = documents_folder
         self.cache_folder = cache_folder
+        self.chat = chat or _ollama_chat
+        self.stream_chat = stream_chat or _ollama_stream
         self.chunk_size = 1000  # Characters per chunk (increased for better context)
         self.chunk_overlap = 200  # Overlap between chunks (increased proportionally)
+        self.encode_batch_size = 64  # Chunks per embedding forward pass
         self.top_k = 5  # Number of relevant chunks to retrieve (increased to find more matches)
+        self.confident_score = 0.85  # Hits this similar are enough on their own; weaker ones are dropped
+        self.sq_min_chunks = 500  # From here, store vectors as 8-bit codes instead of FP32
+        self.ivf_min_chunks = 39 * 256  # FAISS wants 39 training points per 8-bit PQ centroid
         
         # Initialize components
         self.embeddings_model = None
         self.vector_store = None
-        self.chunks = []
-        self.chunk_metadata = []
+        # Chunks are stored column-wise: one UTF-8 blob sliced by offset/length,
+        # plus a source index per chunk into source_names
+        self.text_blob = b""
+        self.offsets = np.zeros(0, dtype=np.int32)
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.source_ids = np.zeros(0, dtype=np.int16)
+        self.source_names = []
+        
+        # Lets the embedding model load in the background while PDFs are found and parsed
+        self._model_lock = threading.Lock()
+        
+        # Repeated questions reuse their embedding instead of re-running the model
+        self._encode_query = lru_cache(maxsize=256)(self._encode_query_uncached)
         
         # Ensure folders exist
         os.makedirs(documents_folder, exist_ok=True)
         os.makedirs(cache_folder, exist_ok=True)
     
-    def _load_embedding_model(self):
-        """Load the sentence transformer model"""
-        try:
-            from sentence_transformers import SentenceTransformer
-            
+    def _load_embedding_model(self, quiet: bool = False):
+        """Load the sentence transformer model (once, even if called from several threads)
+        
+        The background preload passes quiet=True so it never prints over foreground
+        output; the caller that waits for the model reports progress and errors instead.
+        """
+        if self.embeddings_model is not None:
+            return True
+        
+        if not quiet:
             print("📥 Loading embedding model (bge-large-en-v1.5)...")
             print("   This is a high-quality model (~1.34GB) for better accuracy.")
             print("   First-time download may take a few minutes...")
-            # BGE-large is one of the best open-source embedding models
-            # 1024 dimensions, excellent for technical documents
-            self.embeddings_model = SentenceTransformer('BAAI/bge-large-en-v1.5')
+        
+        # Waits here if the background preload is still loading the model
+        with self._model_lock:
+            if self.embeddings_model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    
+                    # BGE-large is one of the best open-source embedding models
+                    # 1024 dimensions, excellent for technical documents
+                    model = SentenceTransformer('BAAI/bge-large-en-v1.5')
+                    
+                    # Half precision halves memory traffic on GPUs; CPUs stay in FP32
+                    import torch
+                    if torch.cuda.is_available():
+                        model.half()
+                    self.embeddings_model = model
+                except ImportError:
+                    if not quiet:
+                        print("❌ sentence-transformers not installed. Run: pip install sentence-transformers")
+                    return False
+                except Exception as e:
+                    if not quiet:
+                        print(f"❌ Failed to load embedding model: {e}")
+                    return False
+        
+        if not quiet:
             print("✅ Embedding model loaded successfully!")
-            return True
-        except ImportError:
-            print("❌ sentence-transformers not installed. Run: pip install sentence-transformers")
-            return False
-        except Exception as e:
-            print(f"❌ Failed to load embedding model: {e}")
-            return False
+        return True
+    
+    def preload_embedding_model(self):
+        """Start loading the embedding model in a background thread, without printing"""
+        # A failed preload leaves the model unset, so the foreground load retries and reports why
+        threading.Thread(target=self._load_embedding_model, kwargs={'quiet': True}, daemon=True).start()
     
     def _load_vector_store(self):
-        """Initialize FAISS vector store"""
+        """Initialize FAISS vector store
+        
+        FAISS gets half the cores so its OpenMP threads don't oversubscribe
+        the CPU alongside PyTorch's threads in the embedding model.
+        """
         try:
             import faiss
             
+            faiss.omp_set_num_threads(max(1, (os.cpu_count() or 1) // 2))
+            
             # We'll initialize this when we have embeddings
             self.faiss = faiss
             return True
@@ -85,56 +265,42 @@ class RAGSystem:
     
     def inspect_chunks(self, max_chunks: int = 10):
         """Inspect what chunks are stored (useful for debugging)"""
-        if not self.chunks:
+        if not len(self.offsets):
             print("❌ No chunks loaded. Process documents first.")
             return
         
-        print(f"\n📊 Total chunks: {len(self.chunks)}")
-        print(f"📏 Showing first {min(max_chunks, len(self.chunks))} chunks:\n")
+        print(f"\n📊 Total chunks: {len(self.offsets)}")
+        print(f"📏 Showing first {min(max_chunks, len(self.offsets))} chunks:\n")
         
-        for i, chunk_meta in enumerate(self.chunk_metadata[:max_chunks], 1):
-            print(f"--- Chunk {i} ---")
+        for i in range(min(max_chunks, len(self.offsets))):
+            chunk_meta = self._get_chunk(i)
+            print(f"--- Chunk {i + 1} ---")
             print(f"Source: {chunk_meta['source']}")
             print(f"Text: {chunk_meta['text'][:150]}...")
             print()
     
-    def _extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF file"""
-        try:
-            import PyPDF2
-            
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-        except ImportError:
-            print("❌ PyPDF2 not installed. Run: pip install PyPDF2")
-            return ""
-        except Exception as e:
-            print(f"❌ Error reading PDF {pdf_path}: {e}")
-            return ""
-    
-    def _chunk_text(self, text: str, filename: str) -> List[dict]:
-        """Split text into overlapping chunks"""
-        chunks = []
+    def _set_chunks(self, chunks: List[dict]):
+        """Pack chunk dicts into the blob/offset/source arrays"""
+        encoded = [chunk['text'].encode('utf-8') for chunk in chunks]
+        self.text_blob = b"".join(encoded)
+        self.lengths = np.fromiter(map(len, encoded), dtype=np.int32, count=len(encoded))
+        self.offsets = np.zeros(len(encoded), dtype=np.int32)
+        np.cumsum(self.lengths[:-1], out=self.offsets[1:])
         
-        # Simple chunking by characters
-        for i in range(0, len(text), self.chunk_size - self.chunk_overlap):
-            chunk_text = text[i:i + self.chunk_size]
-            
-            # Skip very short chunks
-            if len(chunk_text.strip()) < 50:
-                continue
-            
-            chunks.append({
-                'text': chunk_text.strip(),
-                'source': filename,
-                'chunk_id': len(chunks)
-            })
-        
-        return chunks
+        self.source_names = list(dict.fromkeys(chunk['source'] for chunk in chunks))
+        source_index = {name: i for i, name in enumerate(self.source_names)}
+        self.source_ids = np.fromiter(
+            (source_index[chunk['source']] for chunk in chunks), dtype=np.int16, count=len(chunks)
+        )
+    
+    def _get_chunk(self, idx: int) -> dict:
+        """Rebuild one chunk's text and source from the packed arrays"""
+        start = int(self.offsets[idx])
+        return {
+            'text': self.text_blob[start:start + int(self.lengths[idx])].decode('utf-8'),
+            'source': self.source_names[self.source_ids[idx]],
+            'chunk_id': idx
+        }
     
     def _get_cache_path(self, pdf_files: List[str]) -> str:
         """Generate cache path based on PDF files and modification times"""
@@ -147,26 +313,30 @@ class RAGSystem:
                 mtime = str(os.path.getmtime(pdf_file))
                 files_info.append(f"{pdf_file}:{mtime}")
         
-        cache_key = hashlib.md5("|".join(files_info).encode()).hexdigest()
+        cache_key = hashlib.blake2b("|".join(files_info).encode(), digest_size=16).hexdigest()
         return os.path.join(self.cache_folder, f"rag_cache_{cache_key}.pkl")
     
     def _load_from_cache(self, cache_path: str) -> bool:
         """Load processed documents from cache"""
+        index_path = cache_path + '.faiss'
         try:
-            if os.path.exists(cache_path):
+            if os.path.exists(cache_path) and os.path.exists(index_path):
                 print("📋 Loading from cache...")
                 with open(cache_path, 'rb') as f:
                     cache_data = pickle.load(f)
                 
-                self.chunks = cache_data['chunks']
-                self.chunk_metadata = cache_data['metadata']
+                self.text_blob = cache_data['text_blob']
+                self.offsets = cache_data['offsets']
+                self.lengths = cache_data['lengths']
+                self.source_ids = cache_data['source_ids']
+                self.source_names = cache_data['source_names']
                 
-                # Recreate vector store
-                if cache_data['embeddings'] is not None:
-                    embeddings = cache_data['embeddings']
-                    dimension = embeddings.shape[1]
-                    self.vector_store = self.faiss.IndexFlatIP(dimension)  # Inner product for similarity
-                    self.vector_store.add(embeddings.astype('float32'))
+                # The index is stored ready to search, so nothing is re-added or retrained.
+                # Memory-mapping lets the OS page IVF lists in lazily and share them between processes,
+                # so corpora larger than RAM still load; the first queries pay for cold pages.
+                self.vector_store = self._configure_index(
+                    self.faiss.read_index(index_path, self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY)
+                )
                 
                 print("✅ Cache loaded successfully!")
                 return True
@@ -175,28 +345,99 @@ class RAGSystem:
         
         return False
     
-    def _save_to_cache(self, cache_path: str, embeddings: np.ndarray):
+    def _save_to_cache(self, cache_path: str):
         """Save processed documents to cache"""
         try:
             cache_data = {
-                'chunks': self.chunks,
-                'metadata': self.chunk_metadata,
-                'embeddings': embeddings
+                'text_blob': self.text_blob,
+                'offsets': self.offsets,
+                'lengths': self.lengths,
+                'source_ids': self.source_ids,
+                'source_names': self.source_names
             }
             
+            # FAISS serializes the built index in its own binary format
+            self.faiss.write_index(self.vector_store, cache_path + '.faiss')
             with open(cache_path, 'wb') as f:
-                pickle.dump(cache_data, f)
+                pickle.dump(cache_data, f, protocol=pickle.HIGHEST_PROTOCOL)
             
             print("💾 Results cached for faster future loading.")
         except Exception as e:
             print(f"⚠️ Could not save cache: {e}")
     
+    def _encode_chunks(self, texts: List[str], path: str) -> np.ndarray:
+        """Encode texts slab by slab into a memory-mapped float32 array at path
+        
+        Only one slab of embeddings is held in RAM at a time, instead of the
+        encoder's full output plus the stacked copy it makes at the end.
+        """
+        try:
+            # Installed with sentence-transformers; without it encoding just runs silently
+            from tqdm.auto import tqdm
+            progress = tqdm(total=len(texts), desc="Encoding", unit="chunk")
+        except ImportError:
+            progress = None
+        
+        slab = self.encode_batch_size * 16
+        embeddings = None
+        try:
+            for start in range(0, len(texts), slab):
+                # One bar across all slabs rather than a fresh one per encode() call
+                part = self.embeddings_model.encode(
+                    texts[start:start + slab],
+                    batch_size=self.encode_batch_size,
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+                if embeddings is None:
+                    embeddings = np.lib.format.open_memmap(
+                        path, mode='w+', dtype=np.float32, shape=(len(texts), part.shape[1])
+                    )
+                embeddings[start:start + len(part)] = part
+                if progress is not None:
+                    progress.update(len(part))
+        finally:
+            if progress is not None:
+                progress.close()
+        embeddings.flush()
+        return embeddings
+    
+    def _build_index(self, embeddings: np.ndarray):
+        """Build a FAISS inner-product index sized to the number of chunks"""
+        count, dimension = embeddings.shape
+        if count < self.sq_min_chunks:
+            index = self.faiss.IndexFlatIP(dimension)  # Exact search over every chunk
+        elif count < self.ivf_min_chunks:
+            # Full scan over int8 scalar-quantized vectors: a quarter of the memory, near-exact scores
+            index = self.faiss.index_factory(dimension, "SQ8", self.faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+        else:
+            # Large corpora: cluster into cells and compress vectors with product quantization,
+            # so a query only scans a few cells of compact codes
+            # Also keep 39 training points per IVF cell, or FAISS warns and clusters poorly
+            nlist = max(4, min(int(4 * math.sqrt(count)), count // 39))
+            sub_quantizers = max(m for m in range(1, min(dimension // 4, 32) + 1) if dimension % m == 0)
+            index = self.faiss.index_factory(
+                dimension, f"IVF{nlist},PQ{sub_quantizers}x8", self.faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(embeddings)
+            index.nprobe = max(1, nlist // 8)
+        index.add(embeddings)
+        return self._configure_index(index)
+    
+    def _configure_index(self, index):
+        """Apply search settings that FAISS doesn't store with the index"""
+        if isinstance(index, self.faiss.IndexIVF):
+            # Split a single query's probed cells across threads rather than parallelizing over queries
+            index.parallel_mode = 1
+        return index
+    
     def process_documents(self, pdf_files: List[str]) -> bool:
         """Process PDF documents and build vector store"""
         try:
-            # Load required models
-            if not self._load_embedding_model():
-                return False
+            # Load required models; the embedding model keeps loading while PDFs are parsed
+            self.preload_embedding_model()
             
             if not self._load_vector_store():
                 return False
@@ -204,21 +445,33 @@ class RAGSystem:
             # Check cache first
             cache_path = self._get_cache_path(pdf_files)
             if self._load_from_cache(cache_path):
-                return True
+                return self._load_embedding_model()
             
             print("📖 Extracting text from PDFs...")
             
-            # Process each PDF
+            # Process the PDFs in parallel, one process per file since extraction is CPU-bound.
+            # Workers are spawned, not forked, because the model may be loading in another thread.
+            jobs = [(pdf_file, self.chunk_size, self.chunk_overlap) for pdf_file in pdf_files]
+            if len(jobs) > 1:
+                with ProcessPoolExecutor(
+                    max_workers=min(len(jobs), os.cpu_count() or 1),
+                    mp_context=multiprocessing.get_context('spawn')
+                ) as pool:
+                    results = list(pool.map(_extract_and_chunk, jobs))
+            else:
+                results = [_extract_and_chunk(job) for job in jobs]
+            
             all_chunks = []
-            for pdf_file in pdf_files:
+            seen_texts = set()  # Headers/footers repeated across pages and files are embedded once
+            for pdf_file, chunks in zip(pdf_files, results):
                 print(f"   Processing: {os.path.basename(pdf_file)}")
                 
-                text = self._extract_text_from_pdf(pdf_file)
-                if not text.strip():
+                if chunks is None:
                     print(f"⚠️ No text extracted from {pdf_file}")
                     continue
                 
-                chunks = self._chunk_text(text, os.path.basename(pdf_file))
+                chunks = [chunk for chunk in chunks if chunk['text'] not in seen_texts]
+                seen_texts.update(chunk['text'] for chunk in chunks)
                 all_chunks.extend(chunks)
                 print(f"   Created {len(chunks)} text chunks")
             
@@ -226,30 +479,32 @@ class RAGSystem:
                 print("❌ No text chunks created from PDFs")
                 return False
             
-            self.chunks = [chunk['text'] for chunk in all_chunks]
-            self.chunk_metadata = all_chunks
-            
-            print(f"🔤 Generating embeddings for {len(self.chunks)} chunks...")
-            
-            # Generate embeddings
-            embeddings = self.embeddings_model.encode(
-                self.chunks,
-                show_progress_bar=True,
-                convert_to_numpy=True
-            )
+            self._set_chunks(all_chunks)
             
-            print("🗃️ Building vector store...")
+            # Wait for the background load to finish before encoding
+            if not self._load_embedding_model():
+                return False
             
-            # Create FAISS index
-            dimension = embeddings.shape[1]
-            self.vector_store = self.faiss.IndexFlatIP(dimension)  # Inner product similarity
+            print(f"🔤 Generating embeddings for {len(all_chunks)} chunks...")
             
-            # Normalize embeddings for cosine similarity
-            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-            self.vector_store.add(embeddings.astype('float32'))
+            # Generate embeddings, normalized for cosine similarity, straight into a disk-backed array.
+            # The temporary file is removed however encoding or indexing ends.
+            embeddings_path = cache_path + '.tmp.npy'
+            embeddings = None
+            try:
+                embeddings = self._encode_chunks([chunk['text'] for chunk in all_chunks], embeddings_path)
+                
+                print("🗃️ Building vector store...")
+                
+                # Create FAISS index (inner product similarity); FAISS keeps its own copy of the vectors
+                self.vector_store = self._build_index(embeddings)
+            finally:
+                del embeddings
+                if os.path.exists(embeddings_path):
+                    os.remove(embeddings_path)
             
             # Save to cache
-            self._save_to_cache(cache_path, embeddings)
+            self._save_to_cache(cache_path)
             
             return True
             
@@ -257,21 +512,38 @@ class RAGSystem:
             print(f"❌ Error processing documents: {e}")
             return False
     
+    def _encode_query_uncached(self, query: str) -> bytes:
+        """Embed and normalize a query, returned as bytes so it can be cached"""
+        # The encoder normalizes as part of pooling, matching the stored chunk embeddings
+        query_embedding = self.embeddings_model.encode(
+            [query], convert_to_numpy=True, normalize_embeddings=True
+        )
+        return np.ascontiguousarray(query_embedding, dtype='float32').tobytes()
+    
     def _retrieve_relevant_chunks(self, query: str) -> List[dict]:
         """Retrieve most relevant chunks for a query"""
         try:
-            # Generate query embedding
-            query_embedding = self.embeddings_model.encode([query], convert_to_numpy=True)
-            query_embedding = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
+            # Generate query embedding (cached per query string)
+            query_embedding = np.frombuffer(self._encode_query(query), dtype='float32').reshape(1, -1)
             
             # Search vector store
-            scores, indices = self.vector_store.search(query_embedding.astype('float32'), self.top_k)
+            scores, indices = self.vector_store.search(query_embedding, self.top_k)
+            scores, indices = scores[0], indices[0]
+            
+            # With a near-exact match, the weaker hits only pad the prompt and slow generation.
+            # Only exact scores are trusted for this: SQ8 and IVF-PQ scores carry quantization
+            # error comparable to the narrow band BGE similarities fall in.
+            exact = isinstance(self.vector_store, self.faiss.IndexFlat)
+            if exact and len(scores) and scores[0] >= self.confident_score:
+                keep = scores >= self.confident_score
+                scores, indices = scores[keep], indices[keep]
             
             # Return relevant chunks with metadata
             relevant_chunks = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.chunk_metadata):
-                    chunk_info = self.chunk_metadata[idx].copy()
+            for score, idx in zip(scores, indices):
+                # FAISS pads missing results with -1
+                if 0 <= idx < len(self.offsets):
+                    chunk_info = self._get_chunk(int(idx))
                     chunk_info['similarity_score'] = float(score)
                     relevant_chunks.append(chunk_info)
             
@@ -281,8 +553,91 @@ class RAGSystem:
             print(f"❌ Error retrieving chunks: {e}")
             return []
     
-    def query(self, question: str, debug: bool = False) -> str:
-        """Answer a question using RAG"""
+    def _build_context(self, chunks: List[dict]) -> Tuple[str, set]:
+        """Join retrieved chunks into a prompt context and collect their sources"""
+        context_parts = []
+        sources = set()
+        
+        for chunk in chunks:
+            context_parts.append(f"From {chunk['source']}:\n{chunk['text']}")
+            sources.add(chunk['source'])
+        
+        return "\n\n".join(context_parts), sources
+    
+    def retrieve_shared_context(self, questions: List[str]) -> Tuple[str, List[set]]:
+        """Retrieve one deduplicated context covering several questions
+        
+        Returns the combined context and the set of sources used for each question.
+        """
+        shared_chunks = []
+        seen = set()
+        question_sources = []
+        
+        for question in questions:
+            chunks = self._retrieve_relevant_chunks(question)
+            question_sources.append({chunk['source'] for chunk in chunks})
+            for chunk in chunks:
+                key = (chunk['source'], chunk['chunk_id'])
+                if key not in seen:
+                    seen.add(key)
+                    shared_chunks.append(chunk)
+        
+        context, _ = self._build_context(shared_chunks)
+        return context, question_sources
+    
+    def batch_query(self, questions: List[str]) -> List[str]:
+        """Answer several questions with a single LLM call over a shared context"""
+        try:
+            context, question_sources = self.retrieve_shared_context(questions)
+            if not context:
+                return ["❌ No relevant information found in the documents."] * len(questions)
+            
+            numbered = "\n".join(f"[{i}] {question}" for i, question in enumerate(questions, 1))
+            prompt = f"""Based on the following document excerpts, answer each question using only the provided context.
+Reply with one answer per question, each starting on a new line with its number in square brackets, e.g. "[1] ...".
+
+CONTEXT:
+{context}
+
+QUESTIONS:
+{numbered}
+
+ANSWERS:"""
+            
+            print(f"🤔 Generating answers for {len(questions)} questions...")
+            response = self.chat(
+                model='gemma3:270m',
+                messages=[{'role': 'user', 'content': prompt}]
+            )
+            
+            # Split the numbered reply back into per-question answers
+            parsed = {
+                int(index): text.strip()
+                for index, text in re.findall(
+                    r'\[(\d+)\]\s*(.*?)(?=\n\s*\[\d+\]|\Z)',
+                    response['message']['content'],
+                    re.S
+                )
+            }
+            
+            answers = []
+            for i, sources in enumerate(question_sources, 1):
+                answer = parsed.get(i) or "❌ No answer returned for this question."
+                if sources:
+                    answer += f"\n\n📚 Sources: {', '.join(sources)}"
+                answers.append(answer)
+            
+            return answers
+            
+        except Exception as e:
+            return [f"❌ Error generating answer: {e}"] * len(questions)
+    
+    def query(self, question: str, debug: bool = False, stream: bool = False) -> str:
+        """Answer a question using RAG
+        
+        With stream=True the answer (or error) is also printed as it is generated,
+        so the first words show up without waiting for the whole reply.
+        """
         try:
             # Retrieve relevant context
             relevant_chunks = self._retrieve_relevant_chunks(question)
@@ -297,47 +652,37 @@ class RAGSystem:
                 print("\n" + "="*50 + "\n")
             
             if not relevant_chunks:
-                return "❌ No relevant information found in the documents."
+                return self._finish("❌ No relevant information found in the documents.", stream)
             
             # Build context from relevant chunks
-            context_parts = []
-            sources = set()
-            
-            for chunk in relevant_chunks:
-                context_parts.append(f"From {chunk['source']}:\n{chunk['text']}")
-                sources.add(chunk['source'])
-            
-            context = "\n\n".join(context_parts)
+            context, sources = self._build_context(relevant_chunks)
             
             # Create prompt for Ollama
-            prompt = f"""Based on the following document excerpts, please answer the question thoroughly and accurately.
-
-CONTEXT:
-{context}
-
-QUESTION: {question}
-
-Please provide a detailed answer based solely on the information in the provided context. If the context doesn't contain enough information to answer the question completely, please mention what additional information would be helpful.
-
-ANSWER:"""
+            prompt = "".join((_PROMPT_PREFIX, context, _PROMPT_QUESTION, question, _PROMPT_SUFFIX))
             
             # Get response from Ollama
             print("🤔 Generating answer...")
-            response = ollama.chat(
-                model='gemma3:270m',
-                messages=[{'role': 'user', 'content': prompt}]
-            )
-            
-            answer = response['message']['content']
+            messages = [{'role': 'user', 'content': prompt}]
+            if stream:
+                print("\n🤖 AI Analysis:")
+                answer = self.stream_chat(messages)
+            else:
+                answer = self.chat(model='gemma3:270m', messages=messages)['message']['content']
             
             # Add source information
-            sources_list = ", ".join(sources)
-            answer += f"\n\n📚 Sources: {sources_list}"
-            
-            return answer
+            sources_note = f"📚 Sources: {', '.join(sources)}"
+            if stream:
+                print(f"\n{sources_note}")
+            return f"{answer}\n\n{sources_note}"
             
         except Exception as e:
-            return f"❌ Error generating answer: {e}"
+            return self._finish(f"❌ Error generating answer: {e}", stream)
+    
+    def _finish(self, message: str, stream: bool) -> str:
+        """Return a non-answer message, printing it when the caller expects streamed output"""
+        if stream:
+            print(f"\n{message}")
+        return message
 
 
 # Convenience functions for direct use
@@ -367,8 +712,8 @@ if __name__ == "__main__":
         
         if rag.process_documents(pdf_files):
             while True:
-                question = input("\nAsk a question (or 'quit' to exit): ")
-                if question.lower() in ['quit', 'exit']:
+                question = input("\nAsk a question (or 'quit' to exit): ").strip()
+                if question.lower() in {'quit', 'exit'}:
                     break
                 
                 answer = rag.query(question)
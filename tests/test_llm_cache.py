@@ -0,0 +1,81 @@
+"""
+Unit tests for the disk-backed Ollama response cache
+
+This test suite verifies:
+- Cache hits skip the model call
+- Cache keys depend on both model and messages
+- Disabling the cache always queries the model
+"""
+
+import unittest
+from unittest.mock import patch
+import importlib.util
+import os
+import sys
+import tempfile
+
+# Add parent directory to path to import demo modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Checked without importing it; the tests only touch ollama through patch()
+OLLAMA_AVAILABLE = importlib.util.find_spec('ollama') is not None
+
+from app import llm_cache
+
+
+@unittest.skipUnless(OLLAMA_AVAILABLE, "Ollama not available")
+class TestLLMCache(unittest.TestCase):
+    """Test cached_chat behaviour against a temporary database"""
+    
+    def setUp(self):
+        """Point the cache at a throwaway database"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        llm_cache.close()
+        self.addCleanup(llm_cache.close)
+        for name, value in (('CACHE_PATH', os.path.join(self.tmp.name, 'llm_cache.sqlite')),
+                            ('enabled', True)):
+            patcher = patch.object(llm_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.messages = [{'role': 'user', 'content': 'Give me a short poem about AI'}]
+    
+    @patch('ollama.chat')
+    def test_repeat_prompt_is_served_from_cache(self, mock_chat):
+        """Test the second identical request does not reach the model"""
+        mock_chat.return_value = {'message': {'role': 'assistant', 'content': 'Silicon dreams'}}
+        
+        first = llm_cache.cached_chat('gemma3:270m', self.messages)
+        second = llm_cache.cached_chat('gemma3:270m', self.messages)
+        
+        self.assertEqual(first['message']['content'], 'Silicon dreams')
+        self.assertEqual(second['message']['content'], 'Silicon dreams')
+        mock_chat.assert_called_once_with(model='gemma3:270m', messages=self.messages, keep_alive='30m')
+    
+    @patch('ollama.chat')
+    def test_key_includes_model_and_messages(self, mock_chat):
+        """Test different models or messages are cached separately"""
+        mock_chat.return_value = {'message': {'role': 'assistant', 'content': 'reply'}}
+        
+        llm_cache.cached_chat('gemma3:270m', self.messages)
+        llm_cache.cached_chat('other:model', self.messages)
+        llm_cache.cached_chat('gemma3:270m', [{'role': 'user', 'content': 'Something else'}])
+        
+        self.assertEqual(mock_chat.call_count, 3)
+    
+    @patch('ollama.chat')
+    def test_disabled_cache_always_queries_model(self, mock_chat):
+        """Test --no-cache behaviour bypasses stored replies"""
+        mock_chat.return_value = {'message': {'role': 'assistant', 'content': 'reply'}}
+        llm_cache.enabled = False
+        
+        llm_cache.cached_chat('gemma3:270m', self.messages)
+        llm_cache.cached_chat('gemma3:270m', self.messages)
+        
+        self.assertEqual(mock_chat.call_count, 2)
+        self.assertFalse(os.path.exists(llm_cache.CACHE_PATH))
+
+
+if __name__ == '__main__':
+    # Run tests with verbose output
+    unittest.main(verbosity=2)
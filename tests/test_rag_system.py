@@ -0,0 +1,438 @@
+"""
+Unit tests for the RAG system's document handling
+
+This test suite verifies:
+- Boilerplate detection keeps prose and results tables
+- Chunking drops tables of contents, rules and page-number runs
+- Chunk text and sources survive packing into the blob/offset arrays
+- Retrieval handles fewer chunks than top_k
+- Batched questions are answered from one model reply, each with its own sources
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+import importlib.util
+import os
+import sys
+import tempfile
+
+# Add parent directory to path to import demo modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# numpy is the only dependency needed at import time; models and FAISS load lazily
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+FAISS_AVAILABLE = importlib.util.find_spec('faiss') is not None
+
+if NUMPY_AVAILABLE:
+    from rag_system import RAGSystem, _chunk_text, _is_boilerplate, setup_rag_system
+    from app import llm_cache
+    from app.demo import generative
+    from app.streaming import stream_chat
+    import numpy as np
+
+
+PROSE = (
+    "Retrieval-augmented generation combines a neural retriever with a sequence-to-sequence "
+    "generator, letting the model consult documents at inference time instead of relying "
+    "only on what it memorised during training. "
+)
+
+RESULTS_TABLE = (
+    "Table 3: Accuracy by model size.\n"
+    "7B 62.1 64.3 33.5 41.2 58.0 47.9 70.3\n"
+    "13B 66.8 71.2 38.9 45.6 61.7 52.4 73.8\n"
+    "34B 71.4 78.6 45.1 50.3 66.2 58.1 77.5\n"
+    "70B 76.9 84.0 52.7 56.8 70.9 63.4 81.2\n"
+)
+
+TABLE_OF_CONTENTS = (
+    "1 Introduction ........................ 1\n"
+    "2 Related Work ........................ 4\n"
+    "3 Methods ............................. 9\n"
+    "4 Results ............................ 15\n"
+)
+
+PAGE_NUMBERS = "\n".join(str(page) for page in range(100, 160))
+
+RULE = "-" * 80 + "\n" + "_" * 80
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "numpy not available")
+class TestBoilerplateFilter(unittest.TestCase):
+    """Test which chunk windows are considered worth embedding"""
+    
+    def test_prose_is_kept(self):
+        """Test ordinary paragraphs pass the filter"""
+        self.assertFalse(_is_boilerplate(PROSE * 3))
+    
+    def test_results_table_is_kept(self):
+        """Test numeric tables with labels are indexed, not treated as filler"""
+        self.assertFalse(_is_boilerplate(RESULTS_TABLE))
+        self.assertFalse(_is_boilerplate(RESULTS_TABLE * 3))
+    
+    def test_table_of_contents_is_dropped(self):
+        """Test dot-leader TOC entries are filtered out"""
+        self.assertTrue(_is_boilerplate(TABLE_OF_CONTENTS * 3))
+    
+    def test_page_numbers_and_rules_are_dropped(self):
+        """Test runs of bare page numbers and horizontal rules are filtered out"""
+        self.assertTrue(_is_boilerplate(PAGE_NUMBERS))
+        self.assertTrue(_is_boilerplate(RULE))
+    
+    def test_chunk_text_keeps_content_and_drops_boilerplate(self):
+        """Test chunking a mixed document keeps prose and tables but not TOC or page numbers"""
+        sections = [TABLE_OF_CONTENTS * 6, PROSE * 6, RESULTS_TABLE * 6, PAGE_NUMBERS * 3]
+        text = "".join(section[:600].ljust(600) for section in sections)
+        
+        chunks = _chunk_text(text, 'paper.pdf', chunk_size=600, chunk_overlap=0)
+        
+        self.assertEqual(len(chunks), 2)
+        self.assertIn('Retrieval-augmented generation', chunks[0]['text'])
+        self.assertIn('Table 3: Accuracy by model size.', chunks[1]['text'])
+        self.assertEqual([c['chunk_id'] for c in chunks], [0, 1])
+        self.assertTrue(all(c['source'] == 'paper.pdf' for c in chunks))
+    
+    def test_chunk_text_overlaps_and_skips_short_windows(self):
+        """Test windows step by chunk_size - chunk_overlap and tiny tails are dropped"""
+        text = PROSE * 4
+        
+        chunks = _chunk_text(text, 'paper.pdf', chunk_size=300, chunk_overlap=100)
+        
+        self.assertEqual(chunks[0]['text'], text[:300].strip())
+        self.assertEqual(chunks[1]['text'], text[200:500].strip())
+        self.assertTrue(all(len(c['text']) >= 50 for c in chunks))
+
+
+
+def _chunk(text, source, chunk_id):
+    """Retrieved chunk as returned by _retrieve_relevant_chunks"""
+    return {'text': text, 'source': source, 'chunk_id': chunk_id, 'similarity_score': 0.5}
+
+
+def _reply(content):
+    """Chat response carrying the given model output"""
+    return {'message': {'role': 'assistant', 'content': content}}
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "numpy not available")
+class TestChunkStorage(unittest.TestCase):
+    """Test packed chunk storage and retrieval over it (no embedding model needed)"""
+    
+    def setUp(self):
+        """RAG system on throwaway folders"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.rag = RAGSystem(os.path.join(tmp.name, 'documents'), os.path.join(tmp.name, 'cache'))
+        self.chunks = [
+            {'text': 'Plain ASCII chunk.', 'source': 'a.pdf', 'chunk_id': 0},
+            {'text': 'Naïve café résumé — 模型 🚀', 'source': 'b.pdf', 'chunk_id': 0},
+            {'text': '', 'source': 'a.pdf', 'chunk_id': 1},
+            {'text': 'Back to the second source: ß', 'source': 'b.pdf', 'chunk_id': 1},
+        ]
+    
+    def test_set_and_get_chunk_round_trip(self):
+        """Test multi-byte text and sources come back exactly as stored"""
+        self.rag._set_chunks(self.chunks)
+        
+        self.assertEqual(self.rag.source_names, ['a.pdf', 'b.pdf'])
+        self.assertEqual(self.rag.source_ids.tolist(), [0, 1, 0, 1])
+        for idx, chunk in enumerate(self.chunks):
+            rebuilt = self.rag._get_chunk(idx)
+            self.assertEqual(rebuilt['text'], chunk['text'])
+            self.assertEqual(rebuilt['source'], chunk['source'])
+            self.assertEqual(rebuilt['chunk_id'], idx)
+        # Offsets are byte positions, so multi-byte characters must not shift later chunks
+        self.assertEqual(len(self.rag.text_blob), int(self.rag.offsets[-1] + self.rag.lengths[-1]))
+    
+    def test_encoding_shows_one_progress_bar_across_slabs(self):
+        """Test slab-by-slab encoding drives a single bar instead of one per encode() call"""
+        texts = [f'chunk {i}' for i in range(40)]
+        self.rag.encode_batch_size = 1  # 16 texts per slab: three encode() calls
+        self.rag.embeddings_model = MagicMock()
+        self.rag.embeddings_model.encode.side_effect = lambda batch, **kwargs: np.ones((len(batch), 4), dtype='float32')
+        tqdm_auto = MagicMock()
+        path = os.path.join(self.rag.cache_folder, 'embeddings.npy')
+        
+        with patch.dict(sys.modules, {'tqdm': MagicMock(auto=tqdm_auto), 'tqdm.auto': tqdm_auto}):
+            embeddings = self.rag._encode_chunks(texts, path)
+        
+        self.assertEqual(embeddings.shape, (40, 4))
+        del embeddings
+        calls = self.rag.embeddings_model.encode.call_args_list
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all(c.kwargs['show_progress_bar'] is False for c in calls))
+        tqdm_auto.tqdm.assert_called_once_with(total=40, desc="Encoding", unit="chunk")
+        bar = tqdm_auto.tqdm.return_value
+        self.assertEqual([c.args[0] for c in bar.update.call_args_list], [16, 16, 8])
+        bar.close.assert_called_once()
+    
+    @patch('builtins.print')
+    @patch('rag_system._extract_and_chunk')
+    def test_failed_encoding_removes_temporary_embeddings(self, mock_extract, mock_print):
+        """Test an encoding failure does not leave the disk-backed embeddings in cache/"""
+        mock_extract.return_value = self.chunks[:2]
+        
+        def encode_then_fail(texts, path):
+            np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(texts), 4)).flush()
+            raise RuntimeError("encoder crashed")
+        
+        with patch.object(self.rag, 'preload_embedding_model'), \
+                patch.object(self.rag, '_load_vector_store', return_value=True), \
+                patch.object(self.rag, '_load_embedding_model', return_value=True), \
+                patch.object(self.rag, '_encode_chunks', side_effect=encode_then_fail):
+            self.assertFalse(self.rag.process_documents(['documents/paper.pdf']))
+        
+        self.assertEqual(os.listdir(self.rag.cache_folder), [])
+    
+    @unittest.skipUnless(FAISS_AVAILABLE, "faiss not available")
+    def test_fewer_chunks_than_top_k(self):
+        """Test the -1 padding FAISS returns for missing results is not turned into chunks"""
+        import faiss
+        
+        self.assertTrue(self.rag._load_vector_store())
+        self.rag._set_chunks(self.chunks[:2])
+        vectors = np.eye(2, 4, dtype='float32')
+        self.rag.vector_store = faiss.IndexFlatIP(4)
+        self.rag.vector_store.add(vectors)
+        query = np.array([[0.6, 0.8, 0.0, 0.0]], dtype='float32')
+        self.assertGreater(self.rag.top_k, 2)
+        
+        with patch.object(self.rag, '_encode_query', return_value=query.tobytes()):
+            chunks = self.rag._retrieve_relevant_chunks('Which chunk?')
+        
+        self.assertEqual([c['text'] for c in chunks], [self.chunks[1]['text'], self.chunks[0]['text']])
+        self.assertAlmostEqual(chunks[0]['similarity_score'], 0.8, places=5)
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE and FAISS_AVAILABLE, "numpy or faiss not available")
+class TestConfidentFilter(unittest.TestCase):
+    """Test the confident-hit cutoff against exact and quantized indexes"""
+    
+    def setUp(self):
+        """Chunks whose exact similarities to the query straddle the cutoff"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.rag = RAGSystem(os.path.join(tmp.name, 'documents'), os.path.join(tmp.name, 'cache'))
+        self.assertTrue(self.rag._load_vector_store())
+        self.rag._set_chunks([
+            {'text': f'chunk {i}', 'source': 'paper.pdf', 'chunk_id': i} for i in range(3)
+        ])
+        query = np.array([1.0, 0.0, 0.0, 0.0], dtype='float32')
+        # Exact scores 0.95, 0.8 and 0.6: only the first clears confident_score
+        self.embeddings = np.array([
+            [0.95, np.sqrt(1 - 0.95 ** 2), 0.0, 0.0],
+            [0.8, 0.0, 0.6, 0.0],
+            [0.6, 0.0, 0.0, 0.8],
+        ], dtype='float32')
+        patcher = patch.object(self.rag, '_encode_query', return_value=query.reshape(1, -1).tobytes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_exact_index_keeps_only_confident_hits(self):
+        """Test a flat index drops weaker hits once the best one clears the cutoff"""
+        self.rag.vector_store = self.rag._build_index(self.embeddings)
+        self.assertIsInstance(self.rag.vector_store, self.rag.faiss.IndexFlatIP)
+        
+        chunks = self.rag._retrieve_relevant_chunks('query')
+        
+        self.assertEqual([c['text'] for c in chunks], ['chunk 0'])
+    
+    def test_quantized_index_skips_the_cutoff(self):
+        """Test approximate SQ8 scores are not filtered, so quantization error can't drop hits"""
+        self.rag.sq_min_chunks = 0
+        self.rag.vector_store = self.rag._build_index(self.embeddings)
+        self.assertNotIsInstance(self.rag.vector_store, self.rag.faiss.IndexFlat)
+        
+        chunks = self.rag._retrieve_relevant_chunks('query')
+        
+        self.assertEqual([c['text'] for c in chunks], ['chunk 0', 'chunk 1', 'chunk 2'])
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "numpy not available")
+class TestEmbeddingModelLoad(unittest.TestCase):
+    """Test background and foreground model loading (sentence-transformers faked)"""
+    
+    def setUp(self):
+        """RAG system on throwaway folders"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.rag = RAGSystem(os.path.join(tmp.name, 'documents'), os.path.join(tmp.name, 'cache'))
+        self.model = MagicMock(name='SentenceTransformer()')
+        torch = MagicMock(name='torch')
+        torch.cuda.is_available.return_value = False
+        self.modules = {
+            'sentence_transformers': MagicMock(SentenceTransformer=MagicMock(return_value=self.model)),
+            'torch': torch,
+        }
+    
+    @patch('builtins.print')
+    def test_background_load_is_silent(self, mock_print):
+        """Test the preload thread never prints over whatever the foreground is showing"""
+        with patch.dict(sys.modules, self.modules):
+            self.assertTrue(self.rag._load_embedding_model(quiet=True))
+        
+        self.assertIs(self.rag.embeddings_model, self.model)
+        mock_print.assert_not_called()
+    
+    @patch('builtins.print')
+    def test_failed_background_load_is_reported_by_the_waiting_caller(self, mock_print):
+        """Test a silent preload failure is retried and reported in the foreground"""
+        with patch.dict(sys.modules, {'sentence_transformers': None}):
+            self.assertFalse(self.rag._load_embedding_model(quiet=True))
+            mock_print.assert_not_called()
+            
+            self.assertFalse(self.rag._load_embedding_model())
+        
+        printed = "\n".join(str(c.args[0]) for c in mock_print.call_args_list if c.args)
+        self.assertIn("📥 Loading embedding model", printed)
+        self.assertIn("sentence-transformers not installed", printed)
+    
+    @patch('builtins.print')
+    def test_foreground_load_prints_status(self, mock_print):
+        """Test the caller that waits for the model says what it is waiting for"""
+        with patch.dict(sys.modules, self.modules):
+            self.assertTrue(self.rag._load_embedding_model())
+        
+        printed = [str(c.args[0]) for c in mock_print.call_args_list if c.args]
+        self.assertTrue(printed[0].startswith("📥 Loading embedding model"))
+        self.assertEqual(printed[-1], "✅ Embedding model loaded successfully!")
+    
+    @patch('builtins.print')
+    @patch('rag_system.RAGSystem.preload_embedding_model')
+    def test_setup_does_not_preload(self, mock_preload, mock_print):
+        """Test the standalone setup leaves the model load to process_documents"""
+        with patch('rag_system.os.makedirs'):
+            setup_rag_system()
+        
+        mock_preload.assert_not_called()
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "numpy not available")
+class TestBatchQuery(unittest.TestCase):
+    """Test answering several questions with one model call (retrieval and model mocked)"""
+    
+    def setUp(self):
+        """RAG system on throwaway folders, with retrieval keyed by question"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.mock_chat = MagicMock(name='chat')
+        self.rag = RAGSystem(os.path.join(tmp.name, 'documents'), os.path.join(tmp.name, 'cache'),
+                             chat=self.mock_chat)
+        self.retrieved = {
+            'What is RAG?': [_chunk('RAG retrieves documents.', 'rag.pdf', 0)],
+            'How big is the model?': [_chunk('The model has 270M parameters.', 'model.pdf', 3)],
+        }
+        patcher = patch.object(self.rag, '_retrieve_relevant_chunks',
+                               side_effect=lambda question: self.retrieved.get(question, []))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.questions = list(self.retrieved)
+    
+    @patch('builtins.print')
+    def test_answers_matched_by_number_with_own_sources(self, mock_print):
+        """Test out-of-order numbered answers map back to their questions and sources"""
+        self.mock_chat.return_value = _reply("[2] About 270M parameters.\n[1] Retrieval-augmented generation.")
+        
+        answers = self.rag.batch_query(self.questions)
+        
+        self.mock_chat.assert_called_once()
+        self.assertEqual(answers[0], "Retrieval-augmented generation.\n\n📚 Sources: rag.pdf")
+        self.assertEqual(answers[1], "About 270M parameters.\n\n📚 Sources: model.pdf")
+    
+    @patch('builtins.print')
+    def test_multi_line_answers_are_kept_whole(self, mock_print):
+        """Test an answer spanning several lines runs up to the next number"""
+        self.mock_chat.return_value = _reply("[1] It retrieves documents\nand then generates.\n\n[2] 270M.")
+        
+        answers = self.rag.batch_query(self.questions)
+        
+        self.assertTrue(answers[0].startswith("It retrieves documents\nand then generates.\n\n📚"))
+        self.assertTrue(answers[1].startswith("270M.\n\n📚"))
+    
+    @patch('builtins.print')
+    def test_missing_answer_is_reported(self, mock_print):
+        """Test a question the model skipped gets a placeholder, not another question's answer"""
+        self.mock_chat.return_value = _reply("[1] Retrieval-augmented generation.")
+        
+        answers = self.rag.batch_query(self.questions)
+        
+        self.assertTrue(answers[0].startswith("Retrieval-augmented generation."))
+        self.assertTrue(answers[1].startswith("❌ No answer returned for this question."))
+        self.assertIn("model.pdf", answers[1])
+    
+    def test_no_relevant_chunks_skips_the_model(self):
+        """Test nothing retrieved for any question answers every question without a model call"""
+        answers = self.rag.batch_query(['Unrelated?', 'Also unrelated?'])
+        
+        self.mock_chat.assert_not_called()
+        self.assertEqual(answers, ["❌ No relevant information found in the documents."] * 2)
+    
+    @patch('builtins.print')
+    def test_shared_context_is_deduplicated(self, mock_print):
+        """Test a chunk retrieved for two questions appears once in the prompt"""
+        self.retrieved['Again, what is RAG?'] = self.retrieved['What is RAG?']
+        self.mock_chat.return_value = _reply("[1] a\n[2] b")
+        
+        self.rag.batch_query(['What is RAG?', 'Again, what is RAG?'])
+        
+        prompt = self.mock_chat.call_args.kwargs['messages'][0]['content']
+        self.assertEqual(prompt.count('RAG retrieves documents.'), 1)
+    
+    @patch('builtins.print')
+    @patch('ollama.chat')
+    def test_plain_ollama_chat_by_default(self, mock_ollama_chat, mock_print):
+        """Test a standalone RAGSystem (no chat function passed in) calls Ollama directly"""
+        mock_ollama_chat.return_value = _reply("[1] a\n[2] b")
+        rag = RAGSystem(self.rag.documents_folder, self.rag.cache_folder)
+        
+        with patch.object(rag, '_retrieve_relevant_chunks', side_effect=lambda question: self.retrieved[question]):
+            answers = rag.batch_query(self.questions)
+        
+        mock_ollama_chat.assert_called_once()
+        self.assertEqual(mock_ollama_chat.call_args.kwargs['model'], 'gemma3:270m')
+        self.assertTrue(answers[1].startswith("b"))
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "numpy not available")
+class TestGenerativeMode(unittest.TestCase):
+    """Test how the document Q&A loop dispatches questions (RAG system mocked)"""
+    
+    @patch('builtins.print')
+    @patch('builtins.input')
+    @patch('rag_system.RAGSystem')
+    def test_no_pdfs_does_not_load_the_model(self, mock_rag_cls, mock_input, mock_print):
+        """Test an empty documents folder returns to the menu without starting the model load"""
+        rag = mock_rag_cls.return_value
+        rag.find_pdf_files.return_value = []
+        
+        generative()
+        
+        rag.preload_embedding_model.assert_not_called()
+        rag.process_documents.assert_not_called()
+    
+    @patch('builtins.print')
+    @patch('builtins.input')
+    @patch('rag_system.RAGSystem')
+    def test_semicolons_split_into_one_batch(self, mock_rag_cls, mock_input, mock_print):
+        """Test ';'-separated questions go to batch_query and single ones are streamed"""
+        rag = mock_rag_cls.return_value
+        rag.find_pdf_files.return_value = ['documents/paper.pdf']
+        rag.process_documents.return_value = True
+        rag.batch_query.return_value = ['first answer', 'second answer']
+        mock_input.side_effect = ['What is RAG? ; ;How big is the model?;', 'Just one?', 'quit']
+        
+        generative()
+        
+        # The app hands its cached chat and batched printer to the RAG system explicitly
+        mock_rag_cls.assert_called_once_with(chat=llm_cache.cached_chat, stream_chat=stream_chat)
+        rag.batch_query.assert_called_once_with(['What is RAG?', 'How big is the model?'])
+        rag.query.assert_called_once_with('Just one?', stream=True)
+        # process_documents preloads the embedding model itself, once there are PDFs to index
+        rag.preload_embedding_model.assert_not_called()
+        printed = "\n".join(str(c.args[0]) for c in mock_print.call_args_list if c.args)
+        self.assertIn("[2] ❓ How big is the model?", printed)
+        self.assertIn("second answer", printed)
+
+if __name__ == '__main__':
+    # Run tests with verbose output
+    unittest.main(verbosity=2)